@@ -11,4 +11,17 @@ class Config:
     # Ollama configuration - set to true by default to use only Ollama
     USE_OLLAMA = True  # Always use Ollama, no fallback
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3") # Models like llama3, mistral, or gemma use ~6-8GB RAM
-    OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
\ No newline at end of file
+    OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    # Connection pool size and timeout (seconds) for concurrent Ollama requests
+    OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", 10))
+    OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 300))
+    # How long Ollama keeps the model (and its prompt KV cache) loaded between requests
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    # Successful Ollama startup probes are cached here and reused for OLLAMA_PROBE_CACHE_TTL seconds
+    OLLAMA_PROBE_CACHE_FILE = os.getenv("OLLAMA_PROBE_CACHE_FILE", os.path.expanduser("~/.cache/qa_service/ollama_probe.json"))
+    OLLAMA_PROBE_CACHE_TTL = float(os.getenv("OLLAMA_PROBE_CACHE_TTL", 60))
+    # Maximum number of tokens Ollama generates per answer
+    OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", 300))
+    # Store the dense product embedding matrix as int8. Only that copy shrinks (the hnswlib
+    # index keeps float32 vectors), and NumPy scores int8 roughly 3x slower than float32
+    QUANTIZE_EMBEDDINGS = os.getenv("QUANTIZE_EMBEDDINGS", "false").lower() == "true"
\ No newline at end of file
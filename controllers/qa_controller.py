@@ -1,22 +1,35 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from utils.logger import logger
 from services import qa_service
+from services.index_service import summarize_description
 from config import Config
 from utils.session_manager import get_session, update_session_context
+import orjson
 import uuid
 
 bp = Blueprint('qa', __name__, url_prefix='/')
 
 @bp.route('/qa', methods=['POST'])
 def ask_question():
-    question = request.args.get('q', '').strip()
+    # Parameters may come from a JSON body; query parameters are kept for backward compatibility
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    
+    # JSON bodies can carry any type; only strings are valid for these fields
+    for name in ('q', 'session_id'):
+        if data.get(name) is not None and not isinstance(data[name], str):
+            logger.warning(f"Invalid {name} type provided: {type(data[name]).__name__}")
+            return jsonify({"error": "Invalid parameter", "message": f"Parameter '{name}' must be a string"}), 400
+    
+    question = (data.get('q') or request.args.get('q', '')).strip()
     
     if not question:
         logger.warning("Empty question received")
         return jsonify({"error": "Missing parameter", "message": "Question parameter 'q' is required"}), 400
 
     # Get or create session ID
-    session_id = request.args.get('session_id')
+    session_id = data.get('session_id') or request.args.get('session_id')
     if not session_id:
         session_id = str(uuid.uuid4())
         logger.info(f"No session ID provided, created new session: {session_id}")
@@ -24,41 +37,19 @@ def ask_question():
     # Get session data for this user
     session_data = get_session(session_id)
     
+    # Stream tokens as server-sent events when requested
+    stream = data.get('stream', request.args.get('stream', ''))
+    if stream is True or str(stream).lower() in ('1', 'true', 'yes'):
+        return Response(
+            stream_with_context(stream_answer(question, session_id, session_data)),
+            mimetype='text/event-stream'
+        )
+    
     try:
         # Get answer using the session context and question
         qa_response = qa_service.ask_question(question, session_data)
-        
-        # Extract data
-        answer = qa_response["answer"]
-        context_used = qa_response["context_used"]
-        new_product_detected = qa_response["new_product_detected"]
-        usage_stats = qa_response["usage_stats"]
-        
-        # Update session with new context and conversation history
-        update_session_context(session_id, context_used, question, answer)
-        
-        # Prepare response with answer, context info, and performance stats
-        response_data = {
-            "session_id": session_id,
-            "question": question,
-            "answer": answer,
-            "context_changed": new_product_detected,
-            "model_stats": {
-                "model": Config.OLLAMA_MODEL,
-                "peak_memory_mb": usage_stats["peak_memory_mb"],
-                "peak_memory_percent": usage_stats["peak_memory_percent"],
-                "response_time_seconds": usage_stats["duration_seconds"]
-            }
-        }
-        
-        # Add product info if available
-        if context_used:
-            response_data["product"] = {
-                "id": str(context_used["_id"]),
-                "description": context_used["description"][:100] + "..." if len(context_used["description"]) > 100 else context_used["description"]
-            }
-        
-        return jsonify(response_data)
+        response_data = build_response_data(session_id, question, qa_response)
+        return Response(orjson.dumps(response_data), mimetype='application/json')
     except Exception as e:
         logger.error(f"QA error: {str(e)}")
         return jsonify({
@@ -67,3 +58,54 @@ def ask_question():
             "session_id": session_id
         }), 500
 
+def stream_answer(question, session_id, session_data):
+    """Yield server-sent events for each answer chunk, then the full response data"""
+    try:
+        for event in qa_service.ask_question_stream(question, session_data):
+            if "token" in event:
+                yield b"data: " + orjson.dumps({"token": event["token"]}) + b"\n\n"
+            elif "error" in event["usage_stats"]:
+                # Report the failure without recording it in the session
+                error_data = {"error": "QA failed", "message": event["usage_stats"]["error"], "session_id": session_id}
+                yield b"event: error\ndata: " + orjson.dumps(error_data) + b"\n\n"
+            else:
+                response_data = build_response_data(session_id, question, event)
+                yield b"event: done\ndata: " + orjson.dumps(response_data) + b"\n\n"
+    except Exception as e:
+        logger.error(f"QA streaming error: {str(e)}")
+        error_data = {"error": "QA failed", "message": str(e), "session_id": session_id}
+        yield b"event: error\ndata: " + orjson.dumps(error_data) + b"\n\n"
+
+def build_response_data(session_id, question, qa_response):
+    """Update the session with the answer and build the response payload"""
+    # Extract data
+    answer = qa_response["answer"]
+    context_used = qa_response["context_used"]
+    new_product_detected = qa_response["new_product_detected"]
+    usage_stats = qa_response["usage_stats"]
+    
+    # Update session with new context and conversation history
+    update_session_context(session_id, context_used, question, answer)
+    
+    # Prepare response with answer, context info, and performance stats
+    response_data = {
+        "session_id": session_id,
+        "question": question,
+        "answer": answer,
+        "context_changed": new_product_detected,
+        "model_stats": {
+            "model": Config.OLLAMA_MODEL,
+            "peak_memory_mb": usage_stats["peak_memory_mb"],
+            "peak_memory_percent": usage_stats["peak_memory_percent"],
+            "response_time_seconds": usage_stats["duration_seconds"]
+        }
+    }
+    
+    # Add product info if available
+    if context_used:
+        response_data["product"] = {
+            "id": str(context_used["_id"]),
+            "description": context_used.get("summary") or summarize_description(context_used["description"])
+        }
+    
+    return response_data
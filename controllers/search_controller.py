@@ -25,12 +25,14 @@ def search_products():
     
     try:
         query_embedding = embedding_service.encode_query(query_text)
-        labels, distances = index_service.search_index(query_embedding, k)
+        # Search and look up against one index state in case a refresh lands in between
+        state = index_service.get_index_state()
+        labels, distances = index_service.search_index(query_embedding, k, state=state)
         
         results = []
         for idx, dist in zip(labels[0], distances[0]):
             try:
-                product = index_service.get_product_by_index(idx)
+                product = index_service.get_product_by_index(idx, state=state)
                 results.append({
                     "id": str(product['_id']),
                     "description": product['description'],
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 from config import Config
 from utils.logger import logger
@@ -15,5 +16,10 @@ def get_embedding_model():
         raise RuntimeError("Embedding model not initialized")
     return model
 
+@lru_cache(maxsize=4096)
 def encode_query(text):
-    return model.encode(text)
\ No newline at end of file
+    # Cached per text, so the same question or description is only encoded once.
+    # The array is shared between callers and marked read-only to keep it intact.
+    embedding = get_embedding_model().encode(text)
+    embedding.setflags(write=False)
+    return embedding
\ No newline at end of file
@@ -1,16 +1,33 @@
 import hnswlib
+import numpy as np
 import os
 import re
 from config import Config
 from services.database_service import get_products_collection
 from services.embedding_service import get_embedding_model
 from utils.logger import logger
-from datetime import datetime
 
 index = None
 product_ids = []
 products_data = []
 
+# Everything built from one catalog load, published as a single dict by init_index_service:
+#   index, product_ids, products_data,
+#   product_embeddings  L2-normalized description embeddings, row-aligned with products_data
+#   embedding_scales    per-row dequantization scales when product_embeddings is int8, else None
+#   product_positions   {product _id: row in products_data}
+# A lookup that reads it once and passes it along never maps a row from one load onto another.
+index_state = None
+
+SUMMARY_LENGTH = 100  # Characters of description shown in API responses
+
+# Patterns used to standardize cannabis terminology, compiled once at import
+TERM_REPLACEMENTS = [
+    (re.compile(r'(thc|cbd):?\s*(\d+(?:\.\d*)?)%?'), r'\1 \2%'),
+    (re.compile(r'(hybrid|indica|sativa)[ -]?dominant'), r'\1')
+]
+SPECIAL_CHARS_PATTERN = re.compile(r"[^\w\s%]")
+
 def preprocess_description(text):
     """
     Clean and standardize product descriptions for better embeddings
@@ -27,89 +44,157 @@ def preprocess_description(text):
     text = text.lower()
     
     # Standardize cannabis terms
-    replacements = {
-        r'thc:?\s*(\d+\.?\d*)%?': r'thc \1%',
-        r'cbd:?\s*(\d+\.?\d*)%?': r'cbd \1%',
-        r'hybrid[ -]?dominant': 'hybrid',
-        r'indica[ -]?dominant': 'indica',
-        r'sativa[ -]?dominant': 'sativa'
-    }
-    
-    for pattern, replacement in replacements.items():
-        text = re.sub(pattern, replacement, text)
+    for pattern, replacement in TERM_REPLACEMENTS:
+        text = pattern.sub(replacement, text)
     
     # Remove special characters except % for percentages
-    text = re.sub(r"[^\w\s%]", " ", text)
+    text = SPECIAL_CHARS_PATTERN.sub(" ", text)
     
     # Remove extra whitespace
     text = " ".join(text.split())
     
     return text
 
+def summarize_description(text):
+    """Truncate a description to SUMMARY_LENGTH characters for display"""
+    return text[:SUMMARY_LENGTH] + "..." if len(text) > SUMMARY_LENGTH else text
+
 def init_index_service():
-    global index, product_ids, products_data
+    global index, product_ids, products_data, index_state
     logger.info("Initializing index service...")
     
-    products_data = list(get_products_collection().find(
+    # Build everything in locals and publish it as one state dict at the end, so lookups
+    # that hold on to a state never see a half-refreshed index
+    new_products_data = list(get_products_collection().find(
         {}, {"_id": 1, "description": 1}
     ).max_time_ms(5000))
     
-    if not products_data:
+    if not new_products_data:
         raise ValueError("No products found in the database")
     
+    # Precompute display summaries so requests don't re-truncate descriptions
+    for product in new_products_data:
+        product["summary"] = summarize_description(product["description"])
+    
     model = get_embedding_model()
     
     # Preprocess descriptions before embedding
-    descriptions = [preprocess_description(p["description"]) for p in products_data]
+    descriptions = [preprocess_description(p["description"]) for p in new_products_data]
     embeddings = model.encode(descriptions, convert_to_tensor=False)
     
     dim = embeddings.shape[1]
-    index = hnswlib.Index(space="cosine", dim=dim)
+    new_index = hnswlib.Index(space="cosine", dim=dim)
     
     if os.path.exists(Config.INDEX_FILE):
         try:
-            index.load_index(Config.INDEX_FILE)
-            index.set_ef(50)
+            new_index.load_index(Config.INDEX_FILE)
+            new_index.set_ef(50)
             
             # Validate loaded index matches current data
-            if index.get_current_count() != len(products_data):
+            if new_index.get_current_count() != len(new_products_data):
                 logger.warning("Index count mismatch - rebuilding...")
-                create_new_index(embeddings)
+                new_index = hnswlib.Index(space="cosine", dim=dim)
+                create_new_index(new_index, embeddings)
         except Exception as e:
             logger.error(f"Index load failed: {e}")
-            create_new_index(embeddings)
+            new_index = hnswlib.Index(space="cosine", dim=dim)
+            create_new_index(new_index, embeddings)
     else:
-        create_new_index(embeddings)
+        create_new_index(new_index, embeddings)
+    
+    new_product_ids = [p["_id"] for p in new_products_data]
+    normalized = np.asarray(embeddings, dtype=np.float32)
+    normalized = normalized / np.linalg.norm(normalized, axis=1, keepdims=True)
+    scales = None
+    if Config.QUANTIZE_EMBEDDINGS:
+        normalized, scales = quantize_embeddings(normalized)
+    new_positions = {product_id: i for i, product_id in enumerate(new_product_ids)}
     
-    product_ids = [p["_id"] for p in products_data]
+    index_state = {
+        "index": new_index,
+        "product_ids": new_product_ids,
+        "products_data": new_products_data,
+        "product_embeddings": normalized,
+        "embedding_scales": scales,
+        "product_positions": new_positions
+    }
+    # Kept for callers that import the individual names
+    index, product_ids, products_data = new_index, new_product_ids, new_products_data
     logger.info(f"Index initialized with {len(product_ids)} products")
 
-def create_new_index(embeddings):
-    global index
-    index.init_index(
-        max_elements=len(products_data) * 2,  # Allow for growth
+def create_new_index(new_index, embeddings):
+    new_index.init_index(
+        max_elements=len(embeddings) * 2,  # Allow for growth
         ef_construction=200,
         M=16
     )
-    index.add_items(embeddings)
-    index.save_index(Config.INDEX_FILE)
-    logger.info(f"Created new index with {len(products_data)} items")
+    new_index.add_items(embeddings)
+    new_index.save_index(Config.INDEX_FILE)
+    logger.info(f"Created new index with {len(embeddings)} items")
+
+def get_index_state():
+    """Return the current index state; pass it to the lookups below to keep them on one load"""
+    return index_state
 
-def search_index(query_embedding, k):
+def search_index(query_embedding, k, state=None):
+    state = state or index_state
     try:
-        labels, distances = index.knn_query(query_embedding, k=k)
+        labels, distances = state["index"].knn_query(query_embedding, k=k)
         return labels, distances
     except Exception as e:
         logger.error(f"Search failed: {e}")
         raise
 
-def get_product_by_index(idx):
-    if idx >= len(product_ids):
+def quantize_embeddings(embeddings):
+    """Quantize embedding rows to int8 with a per-row scale; returns (quantized, scales)"""
+    scales = (np.max(np.abs(embeddings), axis=1) / 127).astype(np.float32)
+    quantized = np.clip(np.round(embeddings / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+    return quantized, scales
+
+def search_dense(query_embedding, k, state=None):
+    """
+    Exact cosine search over the product embedding matrix. For catalogs of a few
+    thousand products a single matrix-vector product beats the HNSW graph walk.
+    Returns labels and distances shaped like search_index.
+    """
+    state = state or index_state
+    product_embeddings = state["product_embeddings"]
+    embedding_scales = state["embedding_scales"]
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / np.linalg.norm(query)
+    if embedding_scales is None:
+        scores = product_embeddings @ query
+    else:
+        # Quantize the query too and accumulate the int8 products in int32
+        query_scale = np.max(np.abs(query)) / 127
+        quantized_query = np.clip(np.round(query / query_scale), -127, 127).astype(np.int8)
+        scores = np.einsum('ij,j->i', product_embeddings, quantized_query, dtype=np.int32, casting='unsafe')
+        scores = scores * embedding_scales * query_scale
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top[np.newaxis], (1 - scores[top])[np.newaxis]
+
+def get_product_by_index(idx, state=None):
+    state = state or index_state
+    if idx >= len(state["product_ids"]):
         raise IndexError("Index out of range")
-    product_id = product_ids[idx]
-    return next(p for p in products_data if p["_id"] == product_id)
+    # Index labels are assigned in products_data order, so look up by position
+    return state["products_data"][idx]
+
+def get_product_embedding(product, state=None):
+    """Return the precomputed description embedding for a product, or None if it isn't indexed"""
+    state = state or index_state
+    position = state["product_positions"].get(product["_id"])
+    if position is None:
+        return None
+    product_embeddings = state["product_embeddings"]
+    embedding_scales = state["embedding_scales"]
+    if embedding_scales is None:
+        return product_embeddings[position]
+    return product_embeddings[position].astype(np.float32) * embedding_scales[position]
 
 def refresh_index():
     logger.info("Refreshing index...")
     init_index_service()
-    return len(products_data)
\ No newline at end of file
+    return len(index_state["products_data"])
\ No newline at end of file
@@ -1,29 +1,103 @@
 from config import Config
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import numpy as np
+import orjson
 import requests
 from utils.logger import logger
+from utils.ollama_session import session as _session
 from utils.ollama_monitor import OllamaMonitor
 from services import index_service, embedding_service
 
 # Constants
 CONTEXT_SIMILARITY_THRESHOLD = 0.75  # Threshold to determine if we need to change product context
+RESPONSE_CACHE_SIZE = 1024  # Maximum number of cached answers (oldest evicted first)
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = 0.95  # Minimum question similarity to reuse a cached answer
+OLLAMA_PROBE_TIMEOUT = 10  # Seconds to wait for the startup probe so a stalled Ollama can't hang app start
+
+# Context used when no relevant product is found for a question
+DEFAULT_CONTEXT = "You are an AI assistant that answers questions about cannabis products."
+
+# The instructions and product context stay at the start so follow-ups in a session
+# share a stable prompt prefix that Ollama can reuse from its KV cache; only the tail varies.
+# The 8-space indentation is what the model has always been sent; keep it when editing.
+PROMPT_TEMPLATE = """
+        Based on the following context about a cannabis product, please answer the question:
+        
+        Product Context: {context}
+        
+        {conversation_context}
+        
+        Question: {question}
+        
+        Answer:
+        """
+
+# Response cache: exact matches plus near-duplicate questions, so repeat questions skip
+# LLM generation entirely. Entries are keyed on the prompt context, i.e. the product
+# context *and* the session's conversation history, so answers never cross sessions
+# whose prompts differ.
+_exact_cache = OrderedDict()  # {(prompt_context, question): answer}
+_semantic_cache = deque(maxlen=RESPONSE_CACHE_SIZE)  # [(prompt_context, normalized question embedding, answer)]
+_inflight_generations = {}  # {(prompt_context, question): Future} for generations currently running
+_cache_lock = threading.Lock()
 
 def init_qa_service():
     try:
+        # Skip the probe if Ollama was confirmed reachable moments ago (e.g. app reload)
+        if has_fresh_probe():
+            logger.info(f"Ollama probe cached, skipping check for model: {Config.OLLAMA_MODEL}")
+            return
+        
         # Check Ollama connectivity
         try:
-            response = requests.get(f"{Config.OLLAMA_URL}/api/tags")
+            response = _session.get(f"{Config.OLLAMA_URL}/api/tags", timeout=OLLAMA_PROBE_TIMEOUT)
             if response.status_code == 200:
                 logger.info(f"Ollama service detected and ready with model: {Config.OLLAMA_MODEL}")
+                save_probe()
             else:
                 logger.error(f"Ollama service responded with status code: {response.status_code}")
                 raise RuntimeError(f"Ollama service unavailable. Status code: {response.status_code}")
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             logger.error("Couldn't connect to Ollama service")
             raise RuntimeError(f"Could not connect to Ollama at {Config.OLLAMA_URL}. Please make sure Ollama is running.")
     except Exception as e:
         logger.error(f"Failed to initialize QA service: {str(e)}")
         raise
-    return None  # No pipeline needed for Ollama
+
+def has_fresh_probe():
+    """Return True if a successful Ollama probe for the current URL and model was cached recently"""
+    try:
+        with open(Config.OLLAMA_PROBE_CACHE_FILE, 'rb') as f:
+            probe = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return False
+    
+    # A corrupt or hand-edited cache file just means probing Ollama again
+    if not isinstance(probe, dict):
+        return False
+    mtime = probe.get("mtime")
+    if isinstance(mtime, bool) or not isinstance(mtime, (int, float)):
+        return False
+    return (
+        probe.get("ok") is True
+        and probe.get("url") == Config.OLLAMA_URL
+        and probe.get("model") == Config.OLLAMA_MODEL
+        and 0 <= time.time() - mtime < Config.OLLAMA_PROBE_CACHE_TTL
+    )
+
+def save_probe():
+    """Record a successful Ollama probe so a quick restart can skip it"""
+    probe = {"mtime": time.time(), "url": Config.OLLAMA_URL, "model": Config.OLLAMA_MODEL, "ok": True}
+    try:
+        os.makedirs(os.path.dirname(Config.OLLAMA_PROBE_CACHE_FILE), exist_ok=True)
+        with open(Config.OLLAMA_PROBE_CACHE_FILE, 'wb') as f:
+            f.write(orjson.dumps(probe))
+    except OSError as e:
+        logger.warning(f"Could not write Ollama probe cache: {str(e)}")
 
 def ask_question(question, session_data=None):
     """
@@ -37,105 +111,118 @@ def ask_question(question, session_data=None):
     Returns:
         Dictionary with answer, context used (product info), and usage statistics
     """
+    monitor = None
     try:
-        # Create and start the Ollama monitor
+        # Create and start the Ollama monitor; it samples memory in the background
         monitor = OllamaMonitor().start_monitoring()
         
-        # Track if we found a new product context
-        new_product_detected = False
-        context_used = None
-        
-        # Check if we need to search for a new product context
-        if session_data is None or session_data["product_context"] is None:
-            # No existing context - search for product by query
-            logger.info(f"No existing context, searching for product based on query: '{question}'")
-            context_used, new_product_detected = get_product_context_from_query(question)
-        else:
-            # Check if user is asking about a new product or using the existing context
-            is_new_topic = detect_topic_change(question, session_data["product_context"])
-            
-            if is_new_topic:
-                # Search for a new product context
-                logger.info(f"Potential topic change detected in query: '{question}'")
-                context_used, new_product_detected = get_product_context_from_query(question)
-            
-            # If we didn't find a new product context, use the existing one
-            if not new_product_detected:
-                context_used = session_data["product_context"]
-                logger.info("Using existing product context")
-        
-        if context_used is None:
-            # No context found, use a generic response
-            context = "You are an AI assistant that answers questions about cannabis products."
-            logger.warning(f"No product context found for query: '{question}'")
-        else:
-            # Use the product description as context
-            context = context_used["description"]
-        
-        # Build conversation history context if available
-        conversation_context = ""
-        if session_data and session_data["conversation_history"]:
-            conversation_history = session_data["conversation_history"]
-            conversation_context = "\nPrevious conversation:\n"
-            for exchange in conversation_history:
-                conversation_context += f"Q: {exchange['question']}\nA: {exchange['answer']}\n"
-        
-        # Use Ollama for responses with enhanced prompt
-        prompt = f"""
-        Based on the following context about a cannabis product, please answer the question:
-        
-        Product Context: {context}
-        
-        {conversation_context}
+        prepared = prepare_question(question, session_data)
+        context_used = prepared["context_used"]
+        new_product_detected = prepared["new_product_detected"]
         
-        Question: {question}
+        if prepared["cached_answer"] is not None:
+            return {
+                "answer": prepared["cached_answer"],
+                "context_used": context_used,
+                "new_product_detected": new_product_detected,
+                "usage_stats": monitor.stop_monitoring()
+            }
         
-        Answer:
-        """
+        answer = generate_answer(prepared["prompt_context"], question, prepared["question_embedding"], prepared["prompt"])
         
-        # Periodically check and update peak memory usage during request
-        monitor.update_peak_memory()
+        # Stop monitoring and get usage stats
+        usage_stats = monitor.stop_monitoring()
         
-        response = requests.post(
-            f"{Config.OLLAMA_URL}/api/generate",
-            json={
-                "model": Config.OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 300
-                }
+        # Return the answer, context used, and the usage statistics
+        return {
+            "answer": answer,
+            "context_used": context_used,
+            "new_product_detected": new_product_detected,
+            "usage_stats": usage_stats
+        }
+    except Exception as e:
+        # Stop monitoring even if there was an error
+        if monitor is not None and monitor.monitoring:
+            monitor.stop_monitoring()
+        logger.error(f"Error during question answering: {str(e)}")
+        return {
+            "answer": f"I'm sorry, I couldn't process your question: {str(e)}",
+            "context_used": None,
+            "new_product_detected": False,
+            "usage_stats": {
+                "error": str(e)
             }
-        )
+        }
+
+def ask_question_stream(question, session_data=None):
+    """
+    Streaming variant of ask_question that yields answer chunks as Ollama generates them.
+    
+    Yields:
+        Dictionaries of the form {"token": str} for each generated chunk, followed by a
+        final dictionary with the same keys as ask_question's return value
+    """
+    monitor = None
+    try:
+        monitor = OllamaMonitor().start_monitoring()
         
-        # Check memory usage after response
-        monitor.update_peak_memory()
+        prepared = prepare_question(question, session_data)
+        context_used = prepared["context_used"]
+        new_product_detected = prepared["new_product_detected"]
         
-        if response.status_code == 200:
-            result = response.json()
-            answer = result["response"].strip()
-            
-            # Stop monitoring and get usage stats
-            usage_stats = monitor.stop_monitoring()
-            
-            # Return the answer, context used, and the usage statistics
-            return {
-                "answer": answer,
-                "context_used": context_used,
-                "new_product_detected": new_product_detected,
-                "usage_stats": usage_stats
-            }
+        answer = prepared["cached_answer"]
+        if answer is not None:
+            yield {"token": answer}
         else:
-            # Stop monitoring even if there was an error
-            monitor.stop_monitoring()
+            response = _session.post(
+                f"{Config.OLLAMA_URL}/api/generate",
+                json=build_generate_payload(prepared["prompt"], stream=True),
+                timeout=Config.OLLAMA_TIMEOUT,
+                stream=True
+            )
+            try:
+                if response.status_code != 200:
+                    logger.error(f"Ollama request failed: {response.status_code} - {response.text}")
+                    raise RuntimeError(f"Failed to get response from Ollama: {response.text}")
+                
+                chunks = []
+                done = False
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    # Once the 200 header is sent, Ollama reports failures as an error line
+                    if "error" in chunk:
+                        logger.error(f"Ollama stream failed: {chunk['error']}")
+                        raise RuntimeError(f"Failed to get response from Ollama: {chunk['error']}")
+                    token = chunk.get("response", "")
+                    if token:
+                        chunks.append(token)
+                        yield {"token": token}
+                    if chunk.get("done"):
+                        done = True
+                        break
+            finally:
+                response.close()
             
-            logger.error(f"Ollama request failed: {response.status_code} - {response.text}")
-            raise RuntimeError(f"Failed to get response from Ollama: {response.text}")
+            if not done:
+                raise RuntimeError("Ollama stream ended before the answer was complete")
+            
+            answer = "".join(chunks).strip()
+            # Only a stream Ollama marked done holds a complete answer worth reusing; like
+            # the non-streaming path, nothing partial ever reaches the cache
+            if done and answer:
+                cache_answer(prepared["prompt_context"], question, prepared["question_embedding"], answer)
+        
+        yield {
+            "answer": answer,
+            "context_used": context_used,
+            "new_product_detected": new_product_detected,
+            "usage_stats": monitor.stop_monitoring()
+        }
     except Exception as e:
-        logger.error(f"Error during question answering: {str(e)}")
-        return {
+        logger.error(f"Error during streaming question answering: {str(e)}")
+        yield {
             "answer": f"I'm sorry, I couldn't process your question: {str(e)}",
             "context_used": None,
             "new_product_detected": False,
@@ -143,19 +230,190 @@ def ask_question(question, session_data=None):
                 "error": str(e)
             }
         }
+    finally:
+        # Also runs if the client disconnects mid-stream, so the sampler thread never leaks
+        if monitor is not None and monitor.monitoring:
+            monitor.stop_monitoring()
+
+def prepare_question(question, session_data=None):
+    """
+    Resolve the product context for a question and build the Ollama prompt.
+    
+    Returns:
+        Dictionary with the prompt, prompt context (cache key), product context used, whether a new
+        product was detected, the question embedding and any cached answer
+    """
+    # Track if we found a new product context
+    new_product_detected = False
+    context_used = None
+    
+    # Encode the question once; topic detection, product search and the response
+    # cache all work from this embedding
+    question_embedding = embedding_service.encode_query(question)
+    
+    # Check if we need to search for a new product context
+    if session_data is None or session_data["product_context"] is None:
+        # No existing context - search for product by query
+        logger.info(f"No existing context, searching for product based on query: '{question}'")
+        context_used, new_product_detected = get_product_context_from_query(question, question_embedding)
+    else:
+        # Check if user is asking about a new product or using the existing context
+        is_new_topic = detect_topic_change(question, session_data["product_context"], question_embedding)
+        
+        if is_new_topic:
+            # Search for a new product context
+            logger.info(f"Potential topic change detected in query: '{question}'")
+            context_used, new_product_detected = get_product_context_from_query(question, question_embedding)
+        
+        # If we didn't find a new product context, use the existing one
+        if not new_product_detected:
+            context_used = session_data["product_context"]
+            logger.info("Using existing product context")
+    
+    if context_used is None:
+        # No context found, use a generic response
+        context = DEFAULT_CONTEXT
+        logger.warning(f"No product context found for query: '{question}'")
+    else:
+        # Use the product description as context
+        context = context_used["description"]
+    
+    # Build conversation history context if available
+    conversation_context = ""
+    if session_data and session_data["conversation_history"]:
+        conversation_history = session_data["conversation_history"]
+        conversation_context = "\nPrevious conversation:\n" + "".join(
+            f"Q: {exchange['question']}\nA: {exchange['answer']}\n" for exchange in conversation_history
+        )
+    
+    # Everything in the prompt except the question; cached answers are only reused
+    # when this matches exactly
+    prompt_context = (context, conversation_context)
+    
+    # Return a cached answer if this question was already answered for the same prompt context
+    cached_answer = get_exact_cached_answer(prompt_context, question)
+    if cached_answer is None:
+        cached_answer = get_similar_cached_answer(prompt_context, question_embedding)
+    if cached_answer is not None:
+        logger.info(f"Response cache hit for query: '{question}'")
+    
+    # Use Ollama for responses with enhanced prompt
+    prompt = PROMPT_TEMPLATE.format(context=context, conversation_context=conversation_context, question=question)
+    
+    return {
+        "prompt": prompt,
+        "prompt_context": prompt_context,
+        "context_used": context_used,
+        "new_product_detected": new_product_detected,
+        "question_embedding": question_embedding,
+        "cached_answer": cached_answer
+    }
+
+def generate_answer(prompt_context, question, question_embedding, prompt):
+    """
+    Generate an answer with Ollama and cache it. Requests with the same prompt context
+    (product context and conversation history) and question that arrive while a
+    generation is in flight wait for and share its result instead of queueing a
+    duplicate generation behind it.
+    """
+    key = (prompt_context, question)
+    with _cache_lock:
+        future = _inflight_generations.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight_generations[key] = future
+    
+    if not is_owner:
+        logger.info(f"Waiting for in-flight generation of identical query: '{question}'")
+        return future.result()
+    
+    try:
+        response = _session.post(
+            f"{Config.OLLAMA_URL}/api/generate",
+            json=build_generate_payload(prompt, stream=False),
+            timeout=Config.OLLAMA_TIMEOUT
+        )
+        if response.status_code != 200:
+            logger.error(f"Ollama request failed: {response.status_code} - {response.text}")
+            raise RuntimeError(f"Failed to get response from Ollama: {response.text}")
+        
+        result = orjson.loads(response.content)
+        answer = result["response"].strip()
+        cache_answer(prompt_context, question, question_embedding, answer)
+        future.set_result(answer)
+        return answer
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _cache_lock:
+            del _inflight_generations[key]
+
+def build_generate_payload(prompt, stream):
+    """Build the request body for Ollama's /api/generate endpoint"""
+    return {
+        "model": Config.OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": Config.OLLAMA_KEEP_ALIVE,
+        "options": {
+            # Deterministic decoding: since cache entries are keyed on everything in the prompt,
+            # an exact cache hit returns what a fresh generation of that prompt would give
+            "temperature": 0,
+            "num_predict": Config.OLLAMA_NUM_PREDICT,
+            # Stop if the model starts writing the next turn of the conversation itself
+            "stop": ["\nQ:", "\nQuestion:"]
+        }
+    }
+
+def get_exact_cached_answer(prompt_context, question):
+    """Return the cached answer for an identical question with the same prompt context, if any"""
+    with _cache_lock:
+        return _exact_cache.get((prompt_context, question))
+
+def get_similar_cached_answer(prompt_context, question_embedding):
+    """Return the cached answer for the most similar question with the same prompt context, if similar enough"""
+    with _cache_lock:
+        candidates = [(embedding, answer) for cached_context, embedding, answer in _semantic_cache
+                      if cached_context == prompt_context]
+    if not candidates:
+        return None
+    
+    query = np.asarray(question_embedding, dtype=np.float32)
+    query = query / np.linalg.norm(query)
+    similarities = np.stack([embedding for embedding, _ in candidates]) @ query
+    best = int(np.argmax(similarities))
+    if similarities[best] < RESPONSE_CACHE_SIMILARITY_THRESHOLD:
+        return None
+    logger.info(f"Found similar cached question (similarity score: {similarities[best]:.2f})")
+    return candidates[best][1]
+
+def cache_answer(prompt_context, question, question_embedding, answer):
+    """Store an answer for exact and similarity-based reuse under its prompt context"""
+    embedding = np.asarray(question_embedding, dtype=np.float32)
+    embedding = embedding / np.linalg.norm(embedding)
+    with _cache_lock:
+        _exact_cache[(prompt_context, question)] = answer
+        if len(_exact_cache) > RESPONSE_CACHE_SIZE:
+            _exact_cache.popitem(last=False)
+        _semantic_cache.append((prompt_context, embedding, answer))
 
-def get_product_context_from_query(query):
+def get_product_context_from_query(query, query_embedding=None):
     """Search for a product based on the query and return its context"""
     try:
-        # Encode the query for vector search
-        query_embedding = embedding_service.encode_query(query)
+        # Encode the query for vector search unless the caller already did
+        if query_embedding is None:
+            query_embedding = embedding_service.encode_query(query)
         
-        # Search the index with top-1 result
-        labels, distances = index_service.search_index(query_embedding, k=1)
+        # Exact search over the product embeddings with top-1 result; both lookups use the
+        # same index state so a concurrent refresh can't remap the matched row
+        state = index_service.get_index_state()
+        labels, distances = index_service.search_dense(query_embedding, k=1, state=state)
         
         # Check if we have a good match
         if len(labels[0]) > 0 and distances[0][0] < 0.4:  # Lower distance means more similar
-            product = index_service.get_product_by_index(labels[0][0])
+            product = index_service.get_product_by_index(labels[0][0], state=state)
             logger.info(f"Found product context for query (similarity score: {1-distances[0][0]:.2f})")
             return product, True
         else:
@@ -165,7 +423,7 @@ def get_product_context_from_query(query):
         logger.error(f"Error searching for product context: {str(e)}")
         return None, False
 
-def detect_topic_change(question, current_product_context):
+def detect_topic_change(question, current_product_context, question_embedding=None):
     """
     Determine if the user's question is about a different product than the current context.
     
@@ -175,13 +433,21 @@ def detect_topic_change(question, current_product_context):
         return True
         
     try:
-        # Encode the question and current product description
-        question_embedding = embedding_service.encode_query(question)
-        description_embedding = embedding_service.encode_query(current_product_context["description"])
+        # Encode the question unless the caller already did
+        if question_embedding is None:
+            question_embedding = embedding_service.encode_query(question)
+        # Reuse the embedding computed at index build time when the product is indexed.
+        # The fallback encodes the same preprocessed text the index embeds, so similarity
+        # is always measured against one representation of the description.
+        description_embedding = index_service.get_product_embedding(current_product_context)
+        if description_embedding is None:
+            description_embedding = embedding_service.encode_query(
+                index_service.preprocess_description(current_product_context["description"])
+            )
         
         # Calculate cosine similarity between question and current product
-        similarity_score = index_service.index.space.get_distance(question_embedding, description_embedding)
-        similarity_score = 1 - similarity_score  # Convert distance to similarity
+        similarity_score = float(np.dot(question_embedding, description_embedding) /
+                                 (np.linalg.norm(question_embedding) * np.linalg.norm(description_embedding)))
         
         # Check if the question is sufficiently dissimilar from current context
         logger.info(f"Question similarity to current product: {similarity_score:.2f}")
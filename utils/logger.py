@@ -8,7 +8,10 @@ def setup_logger(name):
         os.makedirs('logs')
     
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    # Level is configurable so per-request INFO logging can be turned off in production
+    level = (os.getenv('LOG_LEVEL') or 'INFO').upper()
+    invalid_level = not isinstance(logging.getLevelName(level), int)
+    logger.setLevel('INFO' if invalid_level else level)
     
     # File handler
     file_handler = RotatingFileHandler(
@@ -30,6 +33,10 @@ def setup_logger(name):
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
     
+    # Warn once the handlers exist, so the typo shows up in the usual places
+    if invalid_level:
+        logger.warning(f"Unknown LOG_LEVEL '{level}', using INFO")
+    
     return logger
 
 # Create a global logger instance
@@ -1,24 +1,168 @@
-import psutil
-import requests
+import orjson
+import os
+import sys
+import threading
 import time
 from config import Config
 from utils.logger import logger
+from utils.ollama_session import session as _session
+
+__all__ = [
+    'OllamaMonitor',
+    'get_ollama_process',
+    'find_ollama_process',
+    'list_pids',
+    'is_named_ollama',
+    'cmdline_contains_ollama',
+    'get_model_info',
+    'flush_model_cache',
+    'get_total_memory_bytes'
+]
+
+# How often the background sampler reads Ollama's memory usage during a request. The
+# interval starts short and doubles (up to the maximum) while memory stays stable.
+SAMPLE_INTERVAL_SECONDS = 0.1
+MAX_SAMPLE_INTERVAL_SECONDS = 2.0
+STABLE_SAMPLES_BEFORE_BACKOFF = 3
+STABLE_CHANGE_RATIO = 0.01  # Changes within 1% of the last sample count as stable
+
+# Bytes to megabytes, as a multiplier
+_B2MB = 1.0 / (1024.0 * 1024.0)
+
+# psutil is imported on first use so importing this module stays cheap
+_psutil = None
+
+# Physical memory doesn't change at runtime, so it is read once for percentage calculations
+_total_memory_bytes = None
+
+# Seconds to wait for /api/tags so a hung Ollama cannot stall monitoring
+MODEL_INFO_TIMEOUT = 2
+
+# The model list only changes on pull/remove, so /api/tags responses are reused briefly
+MODEL_INFO_TTL = 5.0
+_model_info_cache = {'time': 0.0, 'value': None}
+MODEL_INFO_FIELDS = ('name', 'size', 'modified_at')
+
+# Name matched against process names and command-line arguments, in str and bytes form
+OLLAMA_PROCESS_NAME = 'ollama'
+_OLLAMA_PROCESS_NAME_BYTES = OLLAMA_PROCESS_NAME.encode()
+
+# PID of the last Ollama process found, reused until it no longer refers to Ollama
+_cached_pid = None
+_pid_lock = threading.Lock()
+
+
+def _lazy_psutil():
+    """Import psutil on first use and return the module"""
+    global _psutil
+    if _psutil is None:
+        import psutil
+        _psutil = psutil
+    return _psutil
+
+
+def get_total_memory_bytes():
+    """Return total physical memory, read once and cached"""
+    global _total_memory_bytes
+    if _total_memory_bytes is None:
+        if sys.platform.startswith('linux'):
+            _total_memory_bytes = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        else:
+            _total_memory_bytes = _lazy_psutil().virtual_memory().total
+    return _total_memory_bytes
 
 
 def get_ollama_process():
+    """Find the Ollama process, reusing the cached PID while it still belongs to Ollama"""
+    global _cached_pid
+    with _pid_lock:
+        if _cached_pid is not None and (is_named_ollama(_cached_pid) or cmdline_contains_ollama(_cached_pid)):
+            return _cached_pid
+        _cached_pid = find_ollama_process()
+        return _cached_pid
+
+
+def find_ollama_process():
     """Find the Ollama process in the system processes"""
-    for process in psutil.process_iter(['pid', 'name', 'cmdline']):
-        if process.info['name'] == 'ollama' or (process.info['cmdline'] and 'ollama' in ' '.join(process.info['cmdline'])):
-            return process.pid
+    pids = list_pids()
+    # Bind the predicates locally; these loops can run over thousands of PIDs
+    named_ollama = is_named_ollama
+    cmdline_ollama = cmdline_contains_ollama
+    
+    # Match on the process name first; it is far cheaper to read than the cmdline
+    for pid in pids:
+        if named_ollama(pid):
+            return pid
+    
+    # Ollama may run under another name (e.g. via a wrapper), so fall back to its arguments
+    for pid in pids:
+        if cmdline_ollama(pid):
+            return pid
     return None
 
 
+def list_pids():
+    """Return the PIDs of all running processes"""
+    if sys.platform.startswith('linux'):
+        # Numeric entries in /proc are PIDs; scandir avoids building psutil's intermediate lists
+        with os.scandir('/proc') as entries:
+            return [int(entry.name) for entry in entries if entry.name.isdigit()]
+    
+    # Use raw PIDs rather than process_iter, which on psutil < 6 re-verifies every
+    # cached process with is_running() and builds an info dict per process
+    return _lazy_psutil().pids()
+
+
+def is_named_ollama(pid):
+    """Return True if the process's name is ollama"""
+    if sys.platform.startswith('linux'):
+        # comm holds just the executable name, the cheapest per-process file to read
+        try:
+            with open(f"/proc/{pid}/comm", 'rb') as f:
+                return f.read().rstrip(b'\n') == _OLLAMA_PROCESS_NAME_BYTES
+        except OSError:
+            return False
+    
+    psutil = _lazy_psutil()
+    try:
+        return psutil.Process(pid).name() == OLLAMA_PROCESS_NAME
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
+def cmdline_contains_ollama(pid):
+    """Return True if any of the process's command-line arguments mentions ollama"""
+    if sys.platform.startswith('linux'):
+        # Match the raw NUL-separated bytes rather than having psutil decode and split them
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                return _OLLAMA_PROCESS_NAME_BYTES in f.read()
+        except OSError:
+            return False
+    
+    psutil = _lazy_psutil()
+    needle = OLLAMA_PROCESS_NAME
+    try:
+        return any(needle in arg for arg in psutil.Process(pid).cmdline())
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
 def get_model_info():
-    """Get information about the currently loaded Ollama models"""
+    """Get information about the currently loaded Ollama models, cached for MODEL_INFO_TTL seconds"""
+    now = time.monotonic()
+    if _model_info_cache['value'] is not None and now - _model_info_cache['time'] < MODEL_INFO_TTL:
+        return _model_info_cache['value']
+    
     try:
-        response = requests.get(f"{Config.OLLAMA_URL}/api/tags")
+        response = _session.get(f"{Config.OLLAMA_URL}/api/tags", timeout=MODEL_INFO_TIMEOUT)
         if response.status_code == 200:
-            return response.json()
+            # Keep only the model fields callers use so the cached copy stays small
+            models = orjson.loads(response.content).get("models", [])
+            model_info = {"models": [{field: model.get(field) for field in MODEL_INFO_FIELDS} for model in models]}
+            _model_info_cache['value'] = model_info
+            _model_info_cache['time'] = now
+            return model_info
         else:
             logger.error(f"Failed to get model info: {response.status_code} - {response.text}")
             return None
@@ -27,6 +171,12 @@ def get_model_info():
         return None
 
 
+def flush_model_cache():
+    """Drop the cached /api/tags response, e.g. after pulling or removing a model"""
+    _model_info_cache['value'] = None
+    _model_info_cache['time'] = 0.0
+
+
 class OllamaMonitor:
     """Monitor Ollama resource usage during generation"""
     
@@ -38,8 +188,27 @@ class OllamaMonitor:
         self.monitoring = False
         self.pid = get_ollama_process()
         self.process = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        # RSS reader for the Ollama process, picked once so samples don't re-check the
+        # platform; None when there is no process to monitor
+        self._read_rss = None
         if self.pid:
-            self.process = psutil.Process(self.pid)
+            if sys.platform.startswith('linux'):
+                # Read RSS straight from /proc; no psutil Process needed
+                self._statm_path = f"/proc/{self.pid}/statm"
+                self._page_size = os.sysconf('SC_PAGE_SIZE')
+                self._read_rss = self._read_statm_rss
+                self._read_errors = (OSError, ValueError, IndexError)
+            else:
+                psutil = _lazy_psutil()
+                try:
+                    self.process = psutil.Process(self.pid)
+                    self._read_rss = self._read_psutil_rss
+                    self._read_errors = (psutil.Error,)
+                except psutil.Error as e:
+                    # Ollama exited (or is inaccessible) since it was found
+                    logger.warning(f"Cannot monitor Ollama process {self.pid}: {str(e)}")
         
     def start_monitoring(self):
         """Start monitoring Ollama resource usage"""
@@ -48,38 +217,73 @@ class OllamaMonitor:
         self.peak_memory_percent = 0
         self.monitoring = True
         # Get initial memory reading
-        if self.process:
-            memory_info = self.process.memory_info()
-            memory_percent = self.process.memory_percent()
-            self.peak_memory_mb = memory_info.rss / (1024 * 1024)
-            self.peak_memory_percent = memory_percent
+        self.update_peak_memory()
+        if self._read_rss is not None:
+            # Sample in the background so the peak during generation is captured
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
         return self
+    
+    def _read_statm_rss(self):
+        """Return the Ollama process's resident memory in bytes from /proc/<pid>/statm"""
+        # statm holds page counts: size, resident, shared, ...
+        with open(self._statm_path, 'rb') as f:
+            return int(f.read().split()[1]) * self._page_size
+    
+    def _read_psutil_rss(self):
+        """Return the Ollama process's resident memory in bytes via psutil"""
+        return self.process.memory_info().rss
+    
+    def _sample(self):
+        """Update peak memory until monitoring stops, sampling less often while memory is stable"""
+        interval = SAMPLE_INTERVAL_SECONDS
+        stable_count = 0
+        last_memory_mb = self.peak_memory_mb
+        while not self._stop_event.wait(interval):
+            current_memory_mb = self.update_peak_memory()
+            if current_memory_mb is None:
+                return  # Ollama exited, nothing left to sample
+            if abs(current_memory_mb - last_memory_mb) <= last_memory_mb * STABLE_CHANGE_RATIO:
+                stable_count += 1
+                if stable_count >= STABLE_SAMPLES_BEFORE_BACKOFF:
+                    interval = min(interval * 2, MAX_SAMPLE_INTERVAL_SECONDS)
+                    stable_count = 0
+            else:
+                # Memory is moving again, go back to sampling quickly
+                interval = SAMPLE_INTERVAL_SECONDS
+                stable_count = 0
+            last_memory_mb = current_memory_mb
         
     def update_peak_memory(self):
-        """Update peak memory if current usage is higher"""
-        if not self.monitoring or not self.process:
-            return
+        """Update peak memory if current usage is higher; returns the current usage in MB, if read"""
+        if not self.monitoring or self._read_rss is None:
+            return None
         
         try:
-            memory_info = self.process.memory_info()
-            memory_percent = self.process.memory_percent()
-            
-            current_memory_mb = memory_info.rss / (1024 * 1024)
-            
-            if current_memory_mb > self.peak_memory_mb:
-                self.peak_memory_mb = current_memory_mb
-                self.peak_memory_percent = memory_percent
-        except:
-            # Process might have exited
-            pass
+            current_memory_mb = self._read_rss() * _B2MB
+        except self._read_errors:
+            # Process has exited; stop sampling it for the rest of this request
+            self._read_rss = None
+            return None
+        
+        if current_memory_mb > self.peak_memory_mb:
+            self.peak_memory_mb = current_memory_mb
+        return current_memory_mb
             
     def stop_monitoring(self):
         """Stop monitoring and return stats"""
+        if self._thread:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
         self.update_peak_memory()  # Final check for peak memory
         self.end_time = time.time()
         self.monitoring = False
         
         duration_seconds = self.end_time - self.start_time
+        # Derive the percentage from the peak instead of querying system memory per sample
+        self.peak_memory_percent = 100.0 * self.peak_memory_mb / (get_total_memory_bytes() * _B2MB)
         
         return {
             "peak_memory_mb": round(self.peak_memory_mb, 2),
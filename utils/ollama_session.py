@@ -0,0 +1,12 @@
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+# Shared HTTP session so Ollama calls reuse keep-alive connections instead of
+# opening a new TCP connection per request. One adapter serves both schemes, so
+# generation and monitoring calls draw from a single connection pool.
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=Config.OLLAMA_POOL_SIZE, pool_maxsize=Config.OLLAMA_POOL_SIZE, max_retries=0)
+session.mount('http://', _adapter)
+session.mount('https://', _adapter)
+session.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})